@@ -1,8 +1,10 @@
 """
 Configuration settings for the application
 """
+from functools import lru_cache
+from pydantic import PrivateAttr, model_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import FrozenSet, List, Optional
 from pathlib import Path
 
 
@@ -13,9 +15,17 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o"
     OPENAI_VISION_MODEL: str = "gpt-4o"
+    OPENAI_STRUCTURED_OUTPUTS: bool = True
     
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./data/document_processor.db"
+    DB_POOL_SIZE: int = 25
+    DB_MAX_OVERFLOW: int = 25
+    DB_POOL_RECYCLE: int = 1800  # seconds
+    DB_POOL_WARMUP: int = 5  # connections opened at startup
+    
+    # Job Queue (arq); when unset, processing runs in-process via BackgroundTasks
+    REDIS_URL: Optional[str] = None
     
     # File Storage
     UPLOAD_DIR: str = "./data/uploads"
@@ -30,8 +40,12 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = 10485760  # 10MB
     ALLOWED_EXTENSIONS: str = "pdf,png,jpg,jpeg,tiff,bmp"
     MAX_CONCURRENT_PROCESSING: int = 5
+    IMAGE_WORKERS: int = 0  # page encoding processes; 0 = one per CPU
+    BATCH_MAX_SIZE: int = 10  # documents coalesced per worker batch
+    BATCH_MAX_WAIT_MS: int = 50  # how long a worker waits to fill a batch
     
     # API Settings
+    USE_X_ACCEL_REDIRECT: bool = False  # only behind the nginx in docker/nginx.conf
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
     CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:8000"]
@@ -40,6 +54,9 @@ class Settings(BaseSettings):
     EXTRACTION_TIMEOUT: int = 120
     RETRY_ATTEMPTS: int = 3
     CONFIDENCE_THRESHOLD: float = 0.7
+    PDF_RENDER_DPI: int = 200
+    MAX_PDF_PAGES: int = 10
+    VISION_MAX_IMAGE_SIZE: int = 2048  # longest side in pixels sent to the Vision API
     
     # Export Settings
     DEFAULT_EXPORT_FORMAT: str = "csv"
@@ -50,20 +67,48 @@ class Settings(BaseSettings):
     ENABLE_VALIDATION: bool = True
     ENABLE_AUTO_CATEGORIZATION: bool = True
     
+    # Parsed ALLOWED_EXTENSIONS, built once at construction
+    _allowed_ext_set: FrozenSet[str] = PrivateAttr(default=frozenset())
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
     
+    @model_validator(mode="after")
+    def _build_allowed_extensions(self) -> "Settings":
+        """Precompute the allowed extension set for O(1) lookups"""
+        self._allowed_ext_set = frozenset(
+            ext.strip().lower() for ext in self.ALLOWED_EXTENSIONS.split(",") if ext.strip()
+        )
+        return self
+    
+    @property
+    def batch_processing_timeout(self) -> int:
+        """
+        Worst case for one worker batch, in seconds
+        
+        Every page of every document is a Vision call bounded by
+        EXTRACTION_TIMEOUT, run MAX_CONCURRENT_PROCESSING at a time.
+        """
+        calls = self.BATCH_MAX_SIZE * self.MAX_PDF_PAGES
+        rounds = -(-calls // self.MAX_CONCURRENT_PROCESSING)
+        return rounds * self.EXTRACTION_TIMEOUT
+    
     @property
     def allowed_extensions_list(self) -> List[str]:
         """Get list of allowed file extensions"""
-        return [ext.strip() for ext in self.ALLOWED_EXTENSIONS.split(",")]
+        return sorted(self._allowed_ext_set)
     
     def validate_file_extension(self, filename: str) -> bool:
         """Check if file extension is allowed"""
-        extension = Path(filename).suffix.lower().lstrip('.')
-        return extension in self.allowed_extensions_list
+        return Path(filename).suffix[1:].lower() in self._allowed_ext_set
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the cached settings instance (parsed once per process)"""
+    return Settings()
 
 
 # Create global settings instance
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
@@ -2,22 +2,65 @@
 Database configuration and initialization
 """
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, JSON
-from datetime import datetime
+from sqlalchemy import (
+    Column, Integer, String, DateTime, Float, Text, JSON, Boolean, Index,
+    event, func, false, inspect, text, insert, update
+)
+from typing import Any, Dict, List
+from datetime import datetime, timezone
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.postgresql import JSONB
+import asyncio
 import logging
 
-from config import settings
+from config import get_settings
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_db_url = make_url(settings.DATABASE_URL)
+_is_sqlite = _db_url.get_backend_name() == "sqlite"
+_is_sqlite_memory = _is_sqlite and _db_url.database in (None, "", ":memory:")
+
+_engine_kwargs = {}
+if _is_sqlite:
+    # Wait on the writer lock instead of failing fast with "database is locked"
+    _engine_kwargs["connect_args"] = {"timeout": 30}
+else:
+    # Network databases: drop dead connections and recycle before server-side timeouts
+    _engine_kwargs.update(pool_pre_ping=True, pool_recycle=settings.DB_POOL_RECYCLE)
+if not _is_sqlite_memory:
+    # The pool class must be explicit: file-backed SQLite otherwise gets a
+    # NullPool, and create_async_engine rejects pool_size/max_overflow for it.
+    # In-memory SQLite uses a StaticPool, which takes no sizing arguments.
+    _engine_kwargs.update(
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW
+    )
 
 # Create async engine
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=False,
-    future=True
+    future=True,
+    **_engine_kwargs
 )
 
+
+if _is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Enable WAL so readers don't block on the writer, and enlarge the page cache"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.close()
+
 # Create async session maker
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -29,9 +72,31 @@ AsyncSessionLocal = async_sessionmaker(
 Base = declarative_base()
 
 
+def _utcnow() -> datetime:
+    """Naive UTC timestamp with sub-second resolution for DateTime columns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# JSON everywhere, binary JSONB on Postgres (no reparse on read, GIN-indexable)
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
+
 class Document(Base):
     """Document model for storing processed documents"""
     __tablename__ = "documents"
+    __table_args__ = (
+        # Serve filtered listings ordered by created_at from the index
+        Index("ix_docs_status_created", "status", "created_at"),
+        Index("ix_docs_doctype_created", "document_type", "created_at"),
+        # Duplicate upload detection
+        Index("ix_docs_content_hash", "content_hash", unique=True),
+        # Containment queries into extracted data (Postgres only)
+        Index(
+            "ix_docs_extracted_data",
+            "extracted_data",
+            postgresql_using="gin",
+            postgresql_ops={"extracted_data": "jsonb_path_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
@@ -39,6 +104,7 @@ class Document(Base):
     file_path = Column(String, nullable=False)
     file_size = Column(Integer)
     file_type = Column(String)
+    content_hash = Column(String(64))  # SHA-256 of the uploaded bytes
     
     # Processing metadata
     status = Column(String, default="pending")  # pending, processing, completed, failed
@@ -47,16 +113,21 @@ class Document(Base):
     processing_time = Column(Float)  # in seconds
     
     # Extracted data
-    extracted_data = Column(JSON)
-    validation_errors = Column(JSON)
+    extracted_data = Column(JSONType)
+    validation_errors = Column(JSONType)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Python-side defaults also cover databases created before the server
+    # defaults existed (create_all does not alter existing tables)
+    created_at = Column(DateTime, default=_utcnow, server_default=func.now(), nullable=False)
+    claimed_at = Column(DateTime)  # when a worker last started processing
     processed_at = Column(DateTime)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(
+        DateTime, default=_utcnow, server_default=func.now(), onupdate=func.now(), nullable=False
+    )
     
     # Export tracking
-    exported = Column(String, default="false")
+    exported = Column(Boolean, nullable=False, default=False, server_default=false())
     export_path = Column(String)
     
     # Error tracking
@@ -73,7 +144,99 @@ class ProcessingLog(Base):
     event_type = Column(String)  # upload, extraction, validation, export, error
     message = Column(Text)
     details = Column(JSON)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=_utcnow, server_default=func.now())
+
+
+# Statements built once and reused for executemany-style batch writes;
+# on SQLAlchemy 2.0 multi-row inserts use insertmanyvalues batching
+DOCUMENT_INSERT = insert(Document).returning(Document.id, sort_by_parameter_order=True)
+DOCUMENT_BULK_UPDATE = update(Document)
+
+
+async def insert_documents(db: AsyncSession, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert document rows in one statement and return their IDs in row order"""
+    result = await db.execute(DOCUMENT_INSERT, rows)
+    return list(result.scalars())
+
+
+async def update_documents(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Bulk update documents by primary key; each row must include its id"""
+    await db.execute(DOCUMENT_BULK_UPDATE, rows)
+
+
+def _add_missing_columns(sync_conn):
+    """Add nullable model columns missing from existing tables"""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            ))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _create_missing_indexes(sync_conn):
+    """Create any model indexes missing from an existing database"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+def _migrate_exported_to_boolean(sync_conn):
+    """Convert a legacy "true"/"false" string exported column to boolean"""
+    columns = {c["name"]: c for c in inspect(sync_conn).get_columns("documents")}
+    column = columns.get("exported")
+    if column is None or not isinstance(column["type"], String):
+        return
+    
+    if sync_conn.dialect.name == "postgresql":
+        sync_conn.execute(text(
+            "ALTER TABLE documents ALTER COLUMN exported DROP DEFAULT, "
+            "ALTER COLUMN exported TYPE BOOLEAN USING COALESCE(exported = 'true', false), "
+            "ALTER COLUMN exported SET DEFAULT false, "
+            "ALTER COLUMN exported SET NOT NULL"
+        ))
+    else:
+        # SQLite cannot change a column type in place; rebuild it (needs SQLite 3.35+)
+        for statement in (
+            "ALTER TABLE documents ADD COLUMN exported_bool BOOLEAN NOT NULL DEFAULT 0",
+            "UPDATE documents SET exported_bool = CASE WHEN exported = 'true' THEN 1 ELSE 0 END",
+            "ALTER TABLE documents DROP COLUMN exported",
+            "ALTER TABLE documents RENAME COLUMN exported_bool TO exported",
+        ):
+            sync_conn.execute(text(statement))
+    logger.info("Migrated documents.exported to boolean")
+
+
+def _migrate_json_to_jsonb(sync_conn):
+    """Convert legacy JSON document columns to JSONB on Postgres"""
+    if sync_conn.dialect.name != "postgresql":
+        return
+    columns = {c["name"]: c for c in inspect(sync_conn).get_columns("documents")}
+    for name in ("extracted_data", "validation_errors"):
+        if name in columns and not isinstance(columns[name]["type"], JSONB):
+            sync_conn.execute(text(
+                f"ALTER TABLE documents ALTER COLUMN {name} TYPE JSONB USING {name}::jsonb"
+            ))
+            logger.info(f"Migrated documents.{name} to JSONB")
+
+
+def _backfill_null_timestamps(sync_conn):
+    """Fill timestamps left NULL by inserts that relied on missing server defaults"""
+    for table, columns in (
+        ("documents", ("created_at", "updated_at")),
+        ("processing_logs", ("timestamp",)),
+    ):
+        for column in columns:
+            result = sync_conn.execute(text(
+                f"UPDATE {table} SET {column} = CURRENT_TIMESTAMP WHERE {column} IS NULL"
+            ))
+            if result.rowcount:
+                logger.info(f"Backfilled {result.rowcount} NULL {table}.{column} values")
 
 
 async def init_db():
@@ -81,12 +244,33 @@ async def init_db():
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            # create_all skips columns and indexes on tables that already exist
+            await conn.run_sync(_add_missing_columns)
+            await conn.run_sync(_migrate_json_to_jsonb)
+            await conn.run_sync(_create_missing_indexes)
+            await conn.run_sync(_migrate_exported_to_boolean)
+            await conn.run_sync(_backfill_null_timestamps)
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
         raise
 
 
+async def warm_pool():
+    """Open pooled connections up front so early requests skip the connect cost"""
+    count = 0 if _is_sqlite_memory else min(settings.DB_POOL_WARMUP, settings.DB_POOL_SIZE)
+    if count <= 0:
+        return
+    
+    async def open_connection():
+        return await engine.connect()
+    
+    connections = await asyncio.gather(*[open_connection() for _ in range(count)])
+    for connection in connections:
+        await connection.close()
+    logger.info(f"Database pool warmed with {count} connections")
+
+
 async def get_db() -> AsyncSession:
     """Dependency for getting database session"""
     async with AsyncSessionLocal() as session:
@@ -2,32 +2,254 @@
 Document processing service using OpenAI Vision API
 Handles document extraction, OCR, and data structuring
 """
+import asyncio
 import base64
+import io
 import logging
+import os
+import re
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Optional, List
-import json
+from statistics import fmean
+from functools import lru_cache
+from typing import Dict, Any, FrozenSet, Optional, List, Tuple
 
-from openai import AsyncOpenAI
+import orjson
+from openai import AsyncOpenAI, BadRequestError
 from PIL import Image
 import PyPDF2
 from pdf2image import convert_from_path
 
-from config import settings
-from schemas import DocumentType, ExtractedField, ExtractedData
+from config import get_settings
+from schemas import DocumentType, ExtractedField, ExtractedData, VisionExtraction
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Matches a leading ```json / ``` fence and a trailing ``` fence
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+# Fallback categorization keywords, in priority order
+# ("billing" is covered by "bill", "invoice number" by "invoice")
+_CATEGORY_KEYWORDS = (
+    ("invoice", "invoice"),
+    ("inv no", "invoice"),
+    ("receipt", "receipt"),
+    ("transaction", "receipt"),
+    ("purchase order", "purchase_order"),
+    ("po number", "purchase_order"),
+    ("bill", "bill"),
+)
+
+
+@lru_cache(maxsize=1024)
+def _categorize_from_names(field_names: FrozenSet[str]) -> str:
+    """Categorize from lowercased field names, keeping the highest-priority match"""
+    best = len(_CATEGORY_KEYWORDS)
+    for name in field_names:
+        for rank in range(best):
+            if _CATEGORY_KEYWORDS[rank][0] in name:
+                best = rank
+                break
+        if best == 0:
+            break
+    
+    return _CATEGORY_KEYWORDS[best][1] if best < len(_CATEGORY_KEYWORDS) else "other"
+
+
+# Required-field rules per document type: (field, accepted names, error, severity)
+_FINANCIAL_FIELD_RULES = (
+    ("total", frozenset({"total", "amount", "total amount", "grand total"}),
+     "Total amount not found", "error"),
+    ("date", frozenset({"date", "invoice date", "receipt date"}),
+     "Date not found", "warning"),
+)
+_REQUIRED_FIELD_RULES = {
+    "invoice": _FINANCIAL_FIELD_RULES,
+    "receipt": _FINANCIAL_FIELD_RULES,
+    "bill": _FINANCIAL_FIELD_RULES,
+}
+
+
+def _missing_required_fields(
+    document_type: str,
+    field_names: List[str]
+) -> Tuple[Tuple[str, FrozenSet[str], str, str], ...]:
+    """Required-field rules not satisfied by the extracted field names"""
+    return tuple(
+        rule for rule in _REQUIRED_FIELD_RULES.get(document_type, ())
+        if rule[1].isdisjoint(field_names)
+    )
+
+
+def _is_response_format_error(error: BadRequestError) -> bool:
+    """Whether a 400 rejects the structured response_format itself"""
+    param = error.param or ""
+    return (
+        param.startswith("response_format")
+        or "response_format" in error.message
+        or "json_schema" in error.message
+    )
+
+
+# Extraction instructions; the response shape comes from the JSON schema
+_EXTRACTION_PROMPT = """
+You are an expert data extraction system. Analyze this document image and extract ALL relevant information in a structured format.
+
+EXTRACTION REQUIREMENTS:
+1. Identify the document type (invoice, receipt, purchase order, bill, statement, form, contract, or other)
+2. Extract ALL text fields with their labels
+3. For each field, determine:
+   - Field name/label
+   - Field value
+   - Data type (text, number, date, currency, email, phone, address)
+   - Your confidence in the extraction (0.0 to 1.0)
+
+4. Common fields to look for:
+   - Document identifiers: invoice number, order number, reference number
+   - Dates: invoice date, due date, order date
+   - Parties: vendor/seller name, customer/buyer name, addresses, contact info
+   - Financial: amounts, subtotals, tax, total, currency
+   - Items: line items with descriptions, quantities, unit prices, amounts
+   - Payment: payment terms, methods, account numbers
+   - Additional: notes, terms and conditions, signatures
+
+5. For tables/line items, extract each row with all columns
+
+Extract as much information as possible. Be thorough and accurate.
+"""
+
+# Fallback prompt for models without structured outputs
+_FALLBACK_PROMPT = _EXTRACTION_PROMPT + """
+RESPONSE FORMAT (JSON only, no markdown):
+{
+  "document_type": "invoice|receipt|purchase_order|bill|statement|form|contract|other",
+  "confidence_score": 0.0-1.0,
+  "fields": [
+    {
+      "field_name": "string",
+      "value": "any",
+      "confidence": 0.0-1.0,
+      "data_type": "text|number|date|currency|email|phone|address"
+    }
+  ],
+  "line_items": [
+    {
+      "description": "string",
+      "quantity": number,
+      "unit_price": number,
+      "amount": number,
+      "confidence": 0.0-1.0
+    }
+  ],
+  "raw_text": "complete extracted text for reference",
+  "metadata": {
+    "has_logo": boolean,
+    "has_signature": boolean,
+    "quality_score": 0.0-1.0,
+    "language": "string"
+  }
+}
+"""
+
+# Prompt content parts are immutable, so build them once
+_EXTRACTION_PROMPT_PART = {"type": "text", "text": _EXTRACTION_PROMPT}
+_FALLBACK_PROMPT_PART = {"type": "text", "text": _FALLBACK_PROMPT}
+
+_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+# Structured output format; the API guarantees replies matching this schema
+_VISION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "document_extraction",
+        "schema": VisionExtraction.model_json_schema(),
+        "strict": True
+    }
+}
 
 # Initialize OpenAI client
 client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
 
 
+def _encode_pages(file_path: str, file_type: str) -> List[str]:
+    """
+    Render/read document pages and base64 encode them entirely in memory
+    
+    Module-level so it can run in a worker process.
+    
+    Args:
+        file_path: Path to document
+        file_type: File type
+        
+    Returns:
+        List of base64 encoded image strings
+    """
+    if file_type == "pdf":
+        images = convert_from_path(
+            file_path,
+            first_page=1,
+            last_page=settings.MAX_PDF_PAGES,
+            dpi=settings.PDF_RENDER_DPI
+        )
+        if not images:
+            raise ValueError("Could not convert PDF to image")
+        return [_encode_pil_image(image) for image in images]
+    
+    image = Image.open(file_path)
+    # Small JPEGs can be sent as-is without a decode/re-encode cycle
+    if image.format == "JPEG" and max(image.size) <= settings.VISION_MAX_IMAGE_SIZE:
+        with open(file_path, 'rb') as image_file:
+            return [base64.b64encode(image_file.read()).decode('ascii')]
+    return [_encode_pil_image(image)]
+
+
+def _encode_pil_image(image: Image.Image) -> str:
+    """
+    Downscale and JPEG/base64 encode a PIL image
+    
+    Args:
+        image: PIL image
+        
+    Returns:
+        Base64 encoded JPEG string
+    """
+    # Downscale before encoding; the model tiles large images internally anyway
+    max_size = settings.VISION_MAX_IMAGE_SIZE
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
 class DocumentProcessor:
     """Main document processing class"""
     
     def __init__(self):
         self.client = client
+        # Bounds concurrent Vision calls across pages and documents
+        self._vision_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_PROCESSING)
+        # Disabled at runtime if the configured model rejects json_schema output
+        self._structured_outputs = settings.OPENAI_STRUCTURED_OUTPUTS
+        # Process pool for CPU-bound page rendering/encoding, set up at startup
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    def start_executor(self):
+        """Start the image encoding process pool"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS or os.cpu_count()
+            )
+    
+    def shutdown_executor(self):
+        """Stop the image encoding process pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
         
     async def process_document(
         self,
@@ -47,20 +269,24 @@ class DocumentProcessor:
         start_time = time.time()
         
         try:
-            # Convert document to image if needed
-            image_data = await self._prepare_image(file_path, file_type)
+            # Convert document pages to images if needed
+            pages = await self._prepare_image(file_path, file_type)
+            
+            # Extract data using Vision API (pages in parallel)
+            extracted_data = await self._extract_with_vision_batch(pages)
             
-            # Extract data using Vision API
-            extracted_data = await self._extract_with_vision(image_data)
+            # Normalize fields once and share them across the helpers below
+            fields = extracted_data.get("fields") or []
+            field_names = [f.get("field_name", "").lower() for f in fields]
             
             # Categorize document type
-            document_type = self._categorize_document(extracted_data)
+            document_type = self._categorize_document(extracted_data, field_names)
             
             # Calculate confidence score
-            confidence_score = self._calculate_confidence(extracted_data)
+            confidence_score = self._calculate_confidence(extracted_data, fields)
             
             # Validate extracted data
-            validation_errors = self._validate_data(extracted_data, document_type)
+            validation_errors = self._validate_data(fields, field_names, document_type)
             
             processing_time = time.time() - start_time
             
@@ -81,39 +307,76 @@ class DocumentProcessor:
                 "processing_time": time.time() - start_time
             }
     
-    async def _prepare_image(self, file_path: str, file_type: str) -> str:
+    async def _prepare_image(self, file_path: str, file_type: str) -> List[str]:
         """
-        Convert document to base64 encoded image
+        Convert document to base64 encoded images, one per page
         
         Args:
             file_path: Path to document
             file_type: File type
             
         Returns:
-            Base64 encoded image string
+            List of base64 encoded image strings
         """
         try:
-            if file_type == "pdf":
-                # Convert PDF first page to image
-                images = convert_from_path(file_path, first_page=1, last_page=1, dpi=300)
-                if images:
-                    # Save temporarily
-                    temp_path = file_path.replace('.pdf', '_temp.jpg')
-                    images[0].save(temp_path, 'JPEG')
-                    file_path = temp_path
-                else:
-                    raise ValueError("Could not convert PDF to image")
-            
-            # Read and encode image
-            with open(file_path, 'rb') as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            return image_data
+            # Decoding, resizing and JPEG/base64 encoding hold the GIL; run them in
+            # the process pool so they scale across cores and never stall the loop
+            if self._executor is not None:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, _encode_pages, file_path, file_type
+                )
+            return await asyncio.to_thread(_encode_pages, file_path, file_type)
             
         except Exception as e:
             logger.error(f"Image preparation failed: {str(e)}")
             raise
     
+    async def _extract_with_vision_batch(self, pages: List[str]) -> Dict[str, Any]:
+        """
+        Extract data from all pages concurrently and merge the results
+        
+        Args:
+            pages: Base64 encoded page images
+            
+        Returns:
+            Merged extracted structured data
+        """
+        async def extract_page(image_data: str) -> Dict[str, Any]:
+            async with self._vision_semaphore:
+                return await self._extract_with_vision(image_data)
+        
+        results = await asyncio.gather(*[extract_page(page) for page in pages])
+        if len(results) == 1:
+            return results[0]
+        return self._merge_page_results(results)
+    
+    def _merge_page_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Merge per-page extraction results into a single document result
+        
+        Args:
+            results: Extracted data for each page, in page order
+            
+        Returns:
+            Merged extracted data
+        """
+        merged = dict(results[0])
+        merged["fields"] = [f for r in results for f in r.get("fields") or []]
+        merged["line_items"] = [i for r in results for i in r.get("line_items") or []]
+        merged["raw_text"] = "\n\n".join(r["raw_text"] for r in results if r.get("raw_text"))
+        merged["page_count"] = len(results)
+        
+        # Confidence weighted by the number of fields found on each page
+        scored = [r for r in results if "confidence_score" in r]
+        if scored:
+            weights = [max(len(r.get("fields") or []), 1) for r in scored]
+            merged["confidence_score"] = sum(
+                float(r["confidence_score"]) * w for r, w in zip(scored, weights)
+            ) / sum(weights)
+        
+        return merged
+    
     async def _extract_with_vision(self, image_data: str) -> Dict[str, Any]:
         """
         Extract data from image using OpenAI Vision API
@@ -125,95 +388,31 @@ class DocumentProcessor:
             Extracted structured data
         """
         try:
-            prompt = """
-You are an expert data extraction system. Analyze this document image and extract ALL relevant information in a structured format.
-
-EXTRACTION REQUIREMENTS:
-1. Identify the document type (invoice, receipt, purchase order, bill, statement, form, contract, or other)
-2. Extract ALL text fields with their labels
-3. For each field, determine:
-   - Field name/label
-   - Field value
-   - Data type (text, number, date, currency, email, phone, address)
-   - Your confidence in the extraction (0.0 to 1.0)
-
-4. Common fields to look for:
-   - Document identifiers: invoice number, order number, reference number
-   - Dates: invoice date, due date, order date
-   - Parties: vendor/seller name, customer/buyer name, addresses, contact info
-   - Financial: amounts, subtotals, tax, total, currency
-   - Items: line items with descriptions, quantities, unit prices, amounts
-   - Payment: payment terms, methods, account numbers
-   - Additional: notes, terms and conditions, signatures
-
-5. For tables/line items, extract each row with all columns
-
-RESPONSE FORMAT (JSON only, no markdown):
-{
-  "document_type": "invoice|receipt|purchase_order|bill|statement|form|contract|other",
-  "confidence_score": 0.0-1.0,
-  "fields": [
-    {
-      "field_name": "string",
-      "value": "any",
-      "confidence": 0.0-1.0,
-      "data_type": "text|number|date|currency|email|phone|address"
-    }
-  ],
-  "line_items": [
-    {
-      "description": "string",
-      "quantity": number,
-      "unit_price": number,
-      "amount": number,
-      "confidence": 0.0-1.0
-    }
-  ],
-  "raw_text": "complete extracted text for reference",
-  "metadata": {
-    "has_logo": boolean,
-    "has_signature": boolean,
-    "quality_score": 0.0-1.0,
-    "language": "string"
-  }
-}
-
-Extract as much information as possible. Be thorough and accurate.
-"""
+            if self._structured_outputs:
+                try:
+                    response = await self._request_vision(
+                        _EXTRACTION_PROMPT_PART, image_data, _VISION_RESPONSE_FORMAT
+                    )
+                    return orjson.loads(response.choices[0].message.content)
+                except BadRequestError as e:
+                    # Other 400s (unreadable image, context length, content
+                    # filter) are about this document, not the model
+                    if not _is_response_format_error(e):
+                        raise
+                    logger.warning(
+                        f"Structured outputs rejected for {settings.OPENAI_VISION_MODEL}, "
+                        f"falling back to prompt-formatted JSON: {str(e)}"
+                    )
+                    self._structured_outputs = False
             
-            response = await self.client.chat.completions.create(
-                model=settings.OPENAI_VISION_MODEL,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=4096,
-                temperature=0.1
-            )
+            # Fallback: describe the shape in the prompt and parse defensively
+            response = await self._request_vision(_FALLBACK_PROMPT_PART, image_data)
             
             # Parse response
             content = response.choices[0].message.content
             
             # Remove markdown code blocks if present
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            extracted_data = json.loads(content.strip())
+            extracted_data = orjson.loads(_FENCE_RE.sub("", content.strip()))
             
             return extracted_data
             
@@ -221,12 +420,61 @@ Extract as much information as possible. Be thorough and accurate.
             logger.error(f"Vision API extraction failed: {str(e)}")
             raise
     
-    def _categorize_document(self, extracted_data: Dict[str, Any]) -> str:
+    async def _request_vision(
+        self,
+        prompt_part: Dict[str, str],
+        image_data: str,
+        response_format: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Send a single prompt + image request to the Vision API
+        
+        The whole call, including the client's own retries, is bounded by
+        EXTRACTION_TIMEOUT.
+        
+        Args:
+            prompt_part: Prebuilt text content part with the instructions
+            image_data: Base64 encoded image
+            response_format: Optional structured output format
+            
+        Returns:
+            Chat completion response
+        """
+        extra = {"response_format": response_format} if response_format else {}
+        request = self.client.chat.completions.create(
+            model=settings.OPENAI_VISION_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        prompt_part,
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": _DATA_URL_PREFIX + image_data,
+                                "detail": "high"
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=4096,
+            temperature=0.1,
+            **extra
+        )
+        return await asyncio.wait_for(request, timeout=settings.EXTRACTION_TIMEOUT)
+    
+    def _categorize_document(
+        self,
+        extracted_data: Dict[str, Any],
+        field_names: List[str]
+    ) -> str:
         """
         Categorize document type based on extracted data
         
         Args:
             extracted_data: Extracted document data
+            field_names: Lowercased field names
             
         Returns:
             Document type string
@@ -235,27 +483,21 @@ Extract as much information as possible. Be thorough and accurate.
         if "document_type" in extracted_data:
             return extracted_data["document_type"]
         
-        # Fallback categorization based on fields
-        fields = extracted_data.get("fields", [])
-        field_names = [f.get("field_name", "").lower() for f in fields]
-        
-        if any(term in " ".join(field_names) for term in ["invoice", "inv no", "invoice number"]):
-            return "invoice"
-        elif any(term in " ".join(field_names) for term in ["receipt", "transaction"]):
-            return "receipt"
-        elif any(term in " ".join(field_names) for term in ["purchase order", "po number"]):
-            return "purchase_order"
-        elif any(term in " ".join(field_names) for term in ["bill", "billing"]):
-            return "bill"
-        else:
-            return "other"
+        # Fallback categorization based on fields; documents from the same
+        # template share field-name sets, so the result is memoized per set
+        return _categorize_from_names(frozenset(field_names))
     
-    def _calculate_confidence(self, extracted_data: Dict[str, Any]) -> float:
+    def _calculate_confidence(
+        self,
+        extracted_data: Dict[str, Any],
+        fields: List[Dict[str, Any]]
+    ) -> float:
         """
         Calculate overall confidence score
         
         Args:
             extracted_data: Extracted document data
+            fields: Extracted fields
             
         Returns:
             Confidence score between 0 and 1
@@ -264,50 +506,35 @@ Extract as much information as possible. Be thorough and accurate.
             return float(extracted_data["confidence_score"])
         
         # Calculate from individual field confidences
-        fields = extracted_data.get("fields", [])
         if not fields:
             return 0.5
         
-        confidences = [f.get("confidence", 0.5) for f in fields]
-        return sum(confidences) / len(confidences) if confidences else 0.5
+        return fmean(f.get("confidence", 0.5) for f in fields)
     
     def _validate_data(
         self,
-        extracted_data: Dict[str, Any],
+        fields: List[Dict[str, Any]],
+        field_names: List[str],
         document_type: str
     ) -> List[Dict[str, str]]:
         """
         Validate extracted data based on document type
         
         Args:
-            extracted_data: Extracted data
+            fields: Extracted fields
+            field_names: Lowercased field names, parallel to fields
             document_type: Type of document
             
         Returns:
             List of validation errors
         """
-        errors = []
-        
-        fields = extracted_data.get("fields", [])
-        field_dict = {f.get("field_name", "").lower(): f for f in fields}
-        
-        # Common validations
-        if document_type in ["invoice", "receipt", "bill"]:
-            # Check for required financial fields
-            if not any(key in field_dict for key in ["total", "amount", "total amount", "grand total"]):
-                errors.append({
-                    "field": "total",
-                    "error": "Total amount not found",
-                    "severity": "error"
-                })
-            
-            # Check for date
-            if not any(key in field_dict for key in ["date", "invoice date", "receipt date"]):
-                errors.append({
-                    "field": "date",
-                    "error": "Date not found",
-                    "severity": "warning"
-                })
+        # Required fields for this document type
+        errors = [
+            {"field": field, "error": error, "severity": severity}
+            for field, _, error, severity in _missing_required_fields(
+                document_type, field_names
+            )
+        ]
         
         # Check confidence scores
         low_confidence_fields = [
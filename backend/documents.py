@@ -1,18 +1,34 @@
 """
 Documents listing and management endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete
-from typing import Optional
+from sqlalchemy import select, func, delete, case
+from typing import List, Optional
+from pydantic import TypeAdapter
+from urllib.parse import quote
 import logging
 
+from config import Settings, get_settings
 from database import get_db, Document
+from process import invalidate_status_cache
 from schemas import DocumentDetail, DocumentList, ProcessingStatistics
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Validates a whole page of ORM rows in one pydantic-core call
+_DOCS_ADAPTER = TypeAdapter(List[DocumentDetail])
+
+# nginx location (internal only) aliased to UPLOAD_DIR
+INTERNAL_UPLOADS_PREFIX = "/internal-uploads/"
+
+
+def _count_status(status: str):
+    """Conditional count of documents in a status (portable alternative to FILTER)"""
+    return func.coalesce(func.sum(case((Document.status == status, 1), else_=0)), 0)
+
 
 @router.get("/documents", response_model=DocumentList)
 async def list_documents(
@@ -26,8 +42,8 @@ async def list_documents(
     List all documents with pagination and filtering
     """
     try:
-        # Build query
-        query = select(Document)
+        # Build query; total is computed as a window column on the same scan
+        query = select(Document, func.count().over().label("total"))
         
         # Apply filters
         if status:
@@ -35,18 +51,9 @@ async def list_documents(
         if document_type:
             query = query.where(Document.document_type == document_type)
         
-        # Order by created_at descending
-        query = query.order_by(Document.created_at.desc())
-        
-        # Get total count
-        count_query = select(func.count()).select_from(Document)
-        if status:
-            count_query = count_query.where(Document.status == status)
-        if document_type:
-            count_query = count_query.where(Document.document_type == document_type)
-        
-        total_result = await db.execute(count_query)
-        total = total_result.scalar()
+        # Order by created_at descending; created_at has one-second resolution
+        # on SQLite, so id breaks ties (newest first, stable paging)
+        query = query.order_by(Document.created_at.desc(), Document.id.desc())
         
         # Apply pagination
         offset = (page - 1) * page_size
@@ -54,11 +61,22 @@ async def list_documents(
         
         # Execute query
         result = await db.execute(query)
-        documents = result.scalars().all()
+        rows = result.all()
+        documents = [row[0] for row in rows]
+        total = rows[0].total if rows else 0
+        
+        # Page past the end: fall back to a plain count so total stays accurate
+        if not rows and offset:
+            count_query = select(func.count()).select_from(Document)
+            if status:
+                count_query = count_query.where(Document.status == status)
+            if document_type:
+                count_query = count_query.where(Document.document_type == document_type)
+            total = (await db.execute(count_query)).scalar()
         
         return DocumentList(
             total=total,
-            documents=[DocumentDetail.model_validate(doc) for doc in documents],
+            documents=_DOCS_ADAPTER.validate_python(documents, from_attributes=True),
             page=page,
             page_size=page_size
         )
@@ -103,6 +121,52 @@ async def get_document(
         )
 
 
+@router.get("/documents/{document_id}/file")
+async def download_document(
+    document_id: int,
+    db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Download the original uploaded file
+    
+    With USE_X_ACCEL_REDIRECT (behind nginx) the response only carries an
+    X-Accel-Redirect header and nginx sends the file from disk; otherwise it
+    is served by the app.
+    """
+    try:
+        result = await db.execute(
+            select(Document.filename, Document.original_filename, Document.file_path)
+            .where(Document.id == document_id)
+        )
+        document = result.one_or_none()
+        
+        if not document:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Document with ID {document_id} not found"
+            )
+        
+        if not settings.USE_X_ACCEL_REDIRECT:
+            return FileResponse(document.file_path, filename=document.original_filename)
+        
+        return Response(headers={
+            "X-Accel-Redirect": f"{INTERNAL_UPLOADS_PREFIX}{document.filename}",
+            "Content-Disposition": (
+                f"attachment; filename*=utf-8''{quote(document.original_filename)}"
+            )
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Download document failed: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to download document: {str(e)}"
+        )
+
+
 @router.delete("/documents/{document_id}")
 async def delete_document(
     document_id: int,
@@ -128,6 +192,7 @@ async def delete_document(
             delete(Document).where(Document.id == document_id)
         )
         await db.commit()
+        invalidate_status_cache(document_id)
         
         # TODO: Delete physical file
         # Path(document.file_path).unlink(missing_ok=True)
@@ -152,41 +217,27 @@ async def get_statistics(db: AsyncSession = Depends(get_db)):
     Get processing statistics and metrics
     """
     try:
-        # Total documents
-        total_result = await db.execute(select(func.count()).select_from(Document))
-        total_documents = total_result.scalar()
-        
-        # Documents by status
-        processed_result = await db.execute(
-            select(func.count()).select_from(Document).where(Document.status == "completed")
-        )
-        processed_documents = processed_result.scalar()
-        
-        failed_result = await db.execute(
-            select(func.count()).select_from(Document).where(Document.status == "failed")
-        )
-        failed_documents = failed_result.scalar()
-        
-        pending_result = await db.execute(
-            select(func.count()).select_from(Document).where(Document.status == "pending")
-        )
-        pending_documents = pending_result.scalar()
-        
-        # Average processing time
-        avg_time_result = await db.execute(
-            select(func.avg(Document.processing_time)).where(
-                Document.processing_time.isnot(None)
-            )
-        )
-        avg_processing_time = avg_time_result.scalar() or 0.0
-        
-        # Average confidence score
-        avg_confidence_result = await db.execute(
-            select(func.avg(Document.confidence_score)).where(
-                Document.confidence_score.isnot(None)
-            )
+        # Counts and averages in a single round-trip
+        summary_result = await db.execute(
+            select(
+                func.count(),
+                _count_status("completed"),
+                _count_status("failed"),
+                _count_status("pending"),
+                func.avg(Document.processing_time),
+                func.avg(Document.confidence_score)
+            ).select_from(Document)
         )
-        avg_confidence_score = avg_confidence_result.scalar() or 0.0
+        (
+            total_documents,
+            processed_documents,
+            failed_documents,
+            pending_documents,
+            avg_processing_time,
+            avg_confidence_score
+        ) = summary_result.one()
+        avg_processing_time = avg_processing_time or 0.0
+        avg_confidence_score = avg_confidence_score or 0.0
         
         # Documents by type
         type_result = await db.execute(
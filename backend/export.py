@@ -2,97 +2,128 @@
 Data export endpoint - FIXED for correct field names
 """
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from typing import AsyncIterator, List
 import csv
-import json
-from pathlib import Path
+import io
 from datetime import datetime
-import uuid
 import logging
 
-from database import get_db, Document
-from config import settings
-from schemas import ExportRequest, ExportResponse
+from database import get_db, AsyncSessionLocal, Document
+from schemas import ExportRequest
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Rows fetched from the database per chunk while streaming an export
+EXPORT_BATCH_SIZE = 500
 
-@router.post("/export", response_model=ExportResponse)
+CSV_HEADER = [
+    'Document ID',
+    'Original Filename',
+    'Document Type',
+    'Field Name',
+    'Field Value',
+    'Confidence Score',
+    'Processing Date'
+]
+
+
+def _document_rows(doc: Document) -> List[list]:
+    """Build CSV rows for a document - one row per extracted field"""
+    processed_at = doc.processed_at.strftime('%Y-%m-%d %H:%M:%S') if doc.processed_at else ''
+    document_type = doc.document_type or 'Unknown'
+    
+    if doc.extracted_data and 'fields' in doc.extracted_data:
+        return [
+            [
+                doc.id,
+                doc.original_filename,
+                document_type,
+                field.get('field_name', ''),
+                field.get('value', ''),  # FIXED: was 'field_value', should be 'value'
+                field.get('confidence', 0),
+                processed_at
+            ]
+            for field in doc.extracted_data['fields']
+        ]
+    
+    # If no extracted fields, just show document info
+    return [[
+        doc.id,
+        doc.original_filename,
+        document_type,
+        'No data',
+        'No data extracted',
+        doc.confidence_score or 0,
+        processed_at
+    ]]
+
+
+def _drain(buffer: io.StringIO) -> str:
+    """Return buffered CSV text and reset the buffer"""
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+async def _stream_csv(query, filename: str) -> AsyncIterator[str]:
+    """
+    Stream CSV rows for the matching documents
+    
+    Uses its own session: the request-scoped one is closed before the
+    response body is sent.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield _drain(buffer)
+    
+    count = 0
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for partition in result.scalars().partitions():
+            for doc in partition:
+                writer.writerows(_document_rows(doc))
+            # Drop loaded rows so memory stays O(batch) rather than O(total)
+            session.expunge_all()
+            count += len(partition)
+            yield _drain(buffer)
+    
+    logger.info(f"Exported {count} documents to {filename}")
+
+
+@router.post("/export")
 async def export_documents(
     request: ExportRequest,
     db: AsyncSession = Depends(get_db)
 ):
-    """Export processed documents to clean CSV"""
+    """Export processed documents to clean CSV, streamed in the response"""
     try:
         # Get documents
         query = select(Document).where(Document.status == "completed")
         if request.document_ids:
             query = query.where(Document.id.in_(request.document_ids))
         
-        result = await db.execute(query)
-        documents = result.scalars().all()
-        
-        if not documents:
+        # Check there is something to export before starting the stream
+        exists_result = await db.execute(
+            query.with_only_columns(Document.id).limit(1)
+        )
+        if exists_result.scalar() is None:
             raise HTTPException(status_code=404, detail="No documents found")
         
-        # Generate export
-        export_id = str(uuid.uuid4())
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"export_{timestamp}.csv"
-        export_path = Path(settings.EXPORT_DIR) / filename
-        
-        # Create clean CSV with extracted fields
-        with open(export_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            # Write header
-            writer.writerow([
-                'Document ID',
-                'Original Filename', 
-                'Document Type',
-                'Field Name',
-                'Field Value',
-                'Confidence Score',
-                'Processing Date'
-            ])
-            
-            # Write data - one row per extracted field
-            for doc in documents:
-                if doc.extracted_data and 'fields' in doc.extracted_data:
-                    for field in doc.extracted_data['fields']:
-                        writer.writerow([
-                            doc.id,
-                            doc.original_filename,
-                            doc.document_type or 'Unknown',
-                            field.get('field_name', ''),
-                            field.get('value', ''),  # FIXED: was 'field_value', should be 'value'
-                            field.get('confidence', 0),
-                            doc.processed_at.strftime('%Y-%m-%d %H:%M:%S') if doc.processed_at else ''
-                        ])
-                else:
-                    # If no extracted fields, just show document info
-                    writer.writerow([
-                        doc.id,
-                        doc.original_filename,
-                        doc.document_type or 'Unknown',
-                        'No data',
-                        'No data extracted',
-                        doc.confidence_score or 0,
-                        doc.processed_at.strftime('%Y-%m-%d %H:%M:%S') if doc.processed_at else ''
-                    ])
-        
-        logger.info(f"Exported {len(documents)} documents to {filename}")
         
-        return ExportResponse(
-            export_id=export_id,
-            filename=filename,
-            format="csv",
-            record_count=len(documents),
-            download_url=f"/exports/{filename}",
-            created_at=datetime.now(),
-            message=f"Successfully exported {len(documents)} documents"
+        return StreamingResponse(
+            _stream_csv(query.order_by(Document.id), filename),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
         
     except HTTPException:
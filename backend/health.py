@@ -4,43 +4,76 @@ Health check endpoint
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, Tuple
+import asyncio
+import time
 
 from database import get_db
-from config import settings
+from config import Settings, get_settings
 from schemas import HealthResponse
 
 router = APIRouter()
 
+# Storage availability rarely changes; cache directory checks per path
+STORAGE_CHECK_TTL = 30.0  # seconds
+_storage_cache: Dict[str, Tuple[float, bool]] = {}
+
+
+async def _check_database(db: AsyncSession) -> str:
+    """Ping the database"""
+    try:
+        await db.execute(text("SELECT 1"))
+        return "healthy"
+    except Exception:
+        return "unhealthy"
+
+
+async def _check_directory(path: str) -> str:
+    """Check a storage directory exists, off the event loop and cached for a TTL"""
+    now = time.monotonic()
+    cached = _storage_cache.get(path)
+    if cached and now - cached[0] < STORAGE_CHECK_TTL:
+        exists = cached[1]
+    else:
+        try:
+            exists = await asyncio.to_thread(Path(path).exists)
+        except OSError:
+            exists = False
+        _storage_cache[path] = (now, exists)
+    return "available" if exists else "unavailable"
+
 
 @router.get("/health", response_model=HealthResponse)
-async def health_check(db: AsyncSession = Depends(get_db)):
+async def health_check(
+    db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings)
+):
     """
     Health check endpoint
     Returns system status and availability
     """
-    # Check database connection
-    try:
-        await db.execute(text("SELECT 1"))
-        db_status = "healthy"
-    except Exception:
-        db_status = "unhealthy"
-    
-    # Check storage directories
-    storage_status = {}
-    for name, path in [
+    directories = [
         ("uploads", settings.UPLOAD_DIR),
         ("processed", settings.PROCESSED_DIR),
         ("exports", settings.EXPORT_DIR),
         ("logs", settings.LOG_DIR)
-    ]:
-        storage_status[name] = "available" if Path(path).exists() else "unavailable"
+    ]
+    
+    # Run database and storage checks concurrently
+    db_status, *storage_results = await asyncio.gather(
+        _check_database(db),
+        *[_check_directory(path) for _, path in directories]
+    )
+    storage_status = {
+        name: result for (name, _), result in zip(directories, storage_results)
+    }
     
     return HealthResponse(
         status="healthy" if db_status == "healthy" else "degraded",
-        timestamp=datetime.utcnow(),
+        timestamp=datetime.now(timezone.utc),
         database=db_status,
         storage=storage_status,
         api_version="1.0.0"
-    )
\ No newline at end of file
+    )
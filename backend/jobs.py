@@ -0,0 +1,75 @@
+"""
+Job queue client for dispatching document processing to arq workers
+"""
+from typing import Optional
+import logging
+
+from arq import create_pool
+from arq.connections import ArqRedis, RedisSettings
+from redis.asyncio.client import PubSub
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PROCESS_DOCUMENT_JOB = "process_document_job"
+
+# Shared Redis pool, created in the app lifespan when REDIS_URL is configured
+_redis: Optional[ArqRedis] = None
+
+
+def redis_settings() -> RedisSettings:
+    """Redis connection settings for the job queue"""
+    return RedisSettings.from_dsn(settings.REDIS_URL or "redis://localhost:6379")
+
+
+async def init_queue():
+    """Connect to the job queue if one is configured"""
+    global _redis
+    if settings.REDIS_URL:
+        _redis = await create_pool(redis_settings())
+        logger.info("Job queue connected")
+
+
+async def close_queue():
+    """Close the job queue connection"""
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
+
+
+def queue_enabled() -> bool:
+    """Whether processing is dispatched to arq workers"""
+    return _redis is not None
+
+
+async def enqueue_processing(document_id: int) -> None:
+    """Enqueue a document for processing by a worker"""
+    await _redis.enqueue_job(PROCESS_DOCUMENT_JOB, document_id)
+
+
+def status_channel(document_id: int) -> str:
+    """Pub/sub channel carrying a document's status changes"""
+    return f"doc:{document_id}"
+
+
+async def publish_status(document_id: int, status: str) -> None:
+    """
+    Push a committed status change to event stream subscribers
+    
+    A failed publish is only logged: the change is already in the database,
+    and clients can still read it from the status endpoint.
+    """
+    if _redis is None:
+        return
+    try:
+        await _redis.publish(status_channel(document_id), status)
+    except Exception as e:
+        logger.warning(f"Status publish failed for document {document_id}: {str(e)}")
+
+
+def status_pubsub() -> PubSub:
+    """New pub/sub connection for following status changes"""
+    return _redis.pubsub()
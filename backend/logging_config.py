@@ -0,0 +1,93 @@
+"""
+Structured (JSON) logging and error metrics
+"""
+from pathlib import Path
+from typing import Optional
+import logging
+import random
+
+import orjson
+import structlog
+from prometheus_client import Counter
+
+# Share of error records that keep their formatted traceback
+TRACEBACK_SAMPLE_RATE = 0.01
+
+# Server errors (unhandled or returned as 5xx) by route template and exception type
+ERRORS_TOTAL = Counter("errors_total", "Server errors (5xx)", ["route", "type"])
+
+
+class TracebackSampler(logging.Filter):
+    """
+    Drop exc_info from all but a sample of records
+    
+    Formatting a traceback is the expensive part of logging an exception,
+    so most records keep only the message. Handles both stdlib records and
+    structlog ones (whose exc_info is still in the event dict). The decision
+    is stored on the record so every handler agrees on it.
+    """
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        event_dict = record.msg if isinstance(record.msg, dict) else {}
+        if record.exc_info or event_dict.get("exc_info"):
+            sampled = getattr(record, "traceback_sampled", None)
+            if sampled is None:
+                sampled = random.random() < TRACEBACK_SAMPLE_RATE
+                record.traceback_sampled = sampled
+            if not sampled:
+                record.exc_info = None
+                record.exc_text = None
+                event_dict.pop("exc_info", None)
+        return True
+
+
+def _dumps(obj, **kwargs) -> str:
+    """JSON serializer for the renderer"""
+    return orjson.dumps(obj, default=str).decode()
+
+
+def configure_logging(level: str, log_file: Optional[Path] = None):
+    """
+    Route stdlib and structlog loggers through a JSON renderer
+    
+    Args:
+        level: Root log level
+        log_file: Optional file written alongside stderr
+    """
+    shared_processors = [
+        structlog.contextvars.merge_contextvars,
+        structlog.stdlib.add_logger_name,
+        structlog.stdlib.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso", utc=True),
+    ]
+    
+    structlog.configure(
+        processors=shared_processors + [
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+    
+    formatter = structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=shared_processors,
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            structlog.processors.JSONRenderer(serializer=_dumps),
+        ],
+    )
+    
+    handlers = [logging.StreamHandler()]
+    if log_file is not None:
+        handlers.append(logging.FileHandler(log_file))
+    
+    sampler = TracebackSampler()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(sampler)
+    
+    root = logging.getLogger()
+    root.handlers = handlers
+    root.setLevel(level)
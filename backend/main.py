@@ -3,31 +3,34 @@ AI-Powered Document Processing System
 Main FastAPI application entry point
 """
 from fastapi import FastAPI, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from contextlib import asynccontextmanager
-import logging
+from prometheus_client import make_asgi_app
 from pathlib import Path
+import asyncio
+import structlog
 
 from config import settings
-from database import init_db
+from database import init_db, warm_pool
+from jobs import init_queue, close_queue
+from document_processor import document_processor
+from logging_config import configure_logging, ERRORS_TOTAL
 import upload, process, export, documents, health
 
-# Ensure log directory exists before configuring logging
-Path(settings.LOG_DIR).mkdir(parents=True, exist_ok=True)
-
-# Configure logging
-logging.basicConfig(
-    level=settings.LOG_LEVEL,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(Path(settings.LOG_DIR) / 'app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Create necessary directories once, before logging is configured and the
+# static file mounts (which require their directories to exist)
+for directory in [settings.UPLOAD_DIR, settings.PROCESSED_DIR,
+                  settings.EXPORT_DIR, settings.LOG_DIR]:
+    Path(directory).mkdir(parents=True, exist_ok=True)
+
+# Configure logging (JSON lines to stderr and the log file)
+configure_logging(settings.LOG_LEVEL, Path(settings.LOG_DIR) / 'app.log')
 
-logger = logging.getLogger(__name__)
+logger = structlog.get_logger(__name__)
 
 
 @asynccontextmanager
@@ -35,25 +38,32 @@ async def lifespan(app: FastAPI):
     """Lifecycle management for the application"""
     # Startup
     logger.info("Starting AI Document Processor...")
-    await init_db()
     
-    # Create necessary directories
-    for directory in [settings.UPLOAD_DIR, settings.PROCESSED_DIR, 
-                      settings.EXPORT_DIR, settings.LOG_DIR]:
-        Path(directory).mkdir(parents=True, exist_ok=True)
+    # Tasks whose coroutine finishes without awaiting I/O (e.g. requests
+    # rejected by validation) complete without a trip through the scheduler
+    if hasattr(asyncio, "eager_task_factory"):  # Python 3.12+
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    
+    await init_db()
+    await warm_pool()
+    await init_queue()
+    document_processor.start_executor()
     
     logger.info("Application started successfully")
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
+    await close_queue()
+    document_processor.shutdown_executor()
 
 
 app = FastAPI(
     title="AI Document Processor",
     description="Automated document data extraction and processing system",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -63,14 +73,44 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Disposition"],
 )
 
 
 # Exception handlers
+def _count_error(request: Request, exc: BaseException) -> str:
+    """Count a server error and return the route it happened on"""
+    # Route template rather than the raw path keeps label cardinality bounded
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    ERRORS_TOTAL.labels(route=route_path, type=type(exc).__name__).inc()
+    return route_path
+
+
+@app.exception_handler(StarletteHTTPException)
+async def server_error_counting_handler(request: Request, exc: StarletteHTTPException):
+    # Routes turn their failures into HTTPException(500); count the original
+    # exception, which is chained as the context of the one raised. Deliberate
+    # 5xx answers (e.g. 503 from /events without Redis) are not failures.
+    original = exc.__cause__ or exc.__context__
+    if exc.status_code == 500 or (exc.status_code > 500 and original is not None):
+        _count_error(request, original or exc)
+    return await http_exception_handler(request, exc)
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Global exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    route_path = _count_error(request, exc)
+    
+    # Tracebacks are sampled by the log handlers (see logging_config)
+    logger.error(
+        "unhandled_exception",
+        route=route_path,
+        error=str(exc),
+        error_type=type(exc).__name__,
+        exc_info=exc
+    )
+    return ORJSONResponse(
         status_code=500,
         content={
             "detail": "An internal error occurred. Please try again later.",
@@ -86,14 +126,15 @@ app.include_router(process.router, prefix="/api", tags=["Process"])
 app.include_router(export.router, prefix="/api", tags=["Export"])
 app.include_router(documents.router, prefix="/api", tags=["Documents"])
 
+# Prometheus metrics
+app.mount("/metrics", make_asgi_app())
 
-# Create directories for static files before mounting
-for directory in [settings.UPLOAD_DIR, settings.PROCESSED_DIR, settings.EXPORT_DIR]:
-    Path(directory).mkdir(parents=True, exist_ok=True)
 
-# Mount static files for uploads (if needed for download)
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
-app.mount("/exports", StaticFiles(directory=settings.EXPORT_DIR), name="exports")
+# Behind nginx, files are sent by nginx (see /api/documents/{id}/file);
+# otherwise the app serves them itself
+if not settings.USE_X_ACCEL_REDIRECT:
+    app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+    app.mount("/exports", StaticFiles(directory=settings.EXPORT_DIR), name="exports")
 
 
 @app.get("/")
@@ -0,0 +1,16 @@
+"""
+One-shot database migration
+
+Creates tables and applies the init_db schema updates. docker-compose runs it
+before the API and the workers start, so they never migrate concurrently.
+"""
+import asyncio
+
+from config import get_settings
+from database import init_db
+from logging_config import configure_logging
+
+
+if __name__ == "__main__":
+    configure_logging(get_settings().LOG_LEVEL)
+    asyncio.run(init_db())
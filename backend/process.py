@@ -1,111 +1,296 @@
 """
 Document processing endpoint
 """
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from datetime import datetime
+from sqlalchemy import select, update, or_, and_
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
+import asyncio
 import logging
 import json
 
-from database import get_db, Document, ProcessingLog
+from database import (
+    get_db, engine, AsyncSessionLocal, Document, ProcessingLog, update_documents
+)
 from schemas import ProcessDocumentResponse, ProcessingStatus
 from document_processor import document_processor
+from jobs import queue_enabled, enqueue_processing, publish_status, status_channel, status_pubsub
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Terminal (completed/failed) status responses don't change until the document
+# is reprocessed or deleted, so polls for them are served from memory
+TERMINAL_STATUSES = ("completed", "failed")
 
-async def process_document_task(document_id: int, db: AsyncSession):
+# States a processing task may claim a document from; anything else means
+# another task already owns it (or it finished and was not re-requested)
+CLAIMABLE_STATUSES = ("pending", "failed")
+
+# Running tasks refresh claimed_at this often; a claim that has missed
+# several refreshes belongs to a task that died or was cancelled
+CLAIM_HEARTBEAT_SECONDS = 30
+STALE_CLAIM_AFTER = timedelta(seconds=CLAIM_HEARTBEAT_SECONDS * 4)
+
+# Comment line sent on idle event streams so proxies keep the connection open
+EVENT_KEEPALIVE_SECONDS = 15
+
+# Cached terminal status responses are the serialized JSON bodies, bounded by
+# their total size: completed responses carry extracted_data, which can run
+# to hundreds of KB per document
+STATUS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_status_cache: "TTLCache[int, bytes]" = TTLCache(
+    maxsize=STATUS_CACHE_MAX_BYTES, ttl=300, getsizeof=len
+)
+
+
+def invalidate_status_cache(document_id: int):
+    """Drop a cached status response (document reprocessed or deleted)"""
+    _status_cache.pop(document_id, None)
+
+
+def _result_values(
+    document_id: int,
+    result: Dict[str, Any],
+    retry_count: Optional[int],
+    now: datetime
+) -> Tuple[Dict[str, Any], ProcessingLog]:
     """
-    Background task to process document
+    Build the document column updates and log entry for a processing result
+    
+    The DateTime columns are naive UTC, so `now` is stored without its tzinfo.
     """
-    try:
-        # Get document from database
-        result = await db.execute(
-            select(Document).where(Document.id == document_id)
+    timestamp = now.replace(tzinfo=None)
+    if result["success"]:
+        # Update document with results
+        values = {
+            "status": "completed",
+            "document_type": result["document_type"],
+            "extracted_data": result["extracted_data"],
+            "confidence_score": result["confidence_score"],
+            "processing_time": result["processing_time"],
+            "validation_errors": result.get("validation_errors", []),
+            "processed_at": timestamp
+        }
+        
+        # Log success
+        log_entry = ProcessingLog(
+            document_id=document_id,
+            event_type="extraction",
+            message="Document processed successfully",
+            timestamp=timestamp,
+            details={
+                "document_type": result["document_type"],
+                "confidence": result["confidence_score"],
+                "processing_time": result["processing_time"]
+            }
         )
-        document = result.scalar_one_or_none()
         
-        if not document:
-            logger.error(f"Document not found: {document_id}")
+        logger.info(
+            f"Document {document_id} processed successfully "
+            f"({result['processing_time']:.2f}s)"
+        )
+    else:
+        # Update status to failed
+        values = {
+            "status": "failed",
+            "error_message": result.get("error", "Unknown error"),
+            "retry_count": (retry_count or 0) + 1
+        }
+        
+        # Log error
+        log_entry = ProcessingLog(
+            document_id=document_id,
+            event_type="error",
+            message=f"Processing failed: {result.get('error')}",
+            timestamp=timestamp,
+            details={"error": result.get("error")}
+        )
+        
+        logger.error(f"Document {document_id} processing failed: {result.get('error')}")
+    
+    return values, log_entry
+
+
+def _stale_claim(now: datetime):
+    """Condition for a processing claim abandoned by its task"""
+    return and_(
+        Document.status == "processing",
+        or_(Document.claimed_at.is_(None), Document.claimed_at < now - STALE_CLAIM_AFTER)
+    )
+
+
+async def _claim_documents(document_ids: List[int]):
+    """
+    Mark documents as processing and return what the extractor needs
+    
+    The conditional UPDATE is the claim: if the same document is enqueued
+    twice, only one task gets its row back and the other skips it. Stale
+    claims are taken over so a crashed task's documents get retried. Runs in
+    a short transaction of its own so the state is visible to status polls;
+    no connection is held during extraction.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async with engine.begin() as conn:
+        claim = await conn.execute(
+            update(Document)
+            .where(
+                Document.id.in_(document_ids),
+                or_(Document.status.in_(CLAIMABLE_STATUSES), _stale_claim(now))
+            )
+            .values(status="processing", claimed_at=now)
+            .returning(
+                Document.id, Document.file_path, Document.file_type, Document.retry_count
+            )
+        )
+        rows = claim.all()
+    
+    await asyncio.gather(*[publish_status(row.id, "processing") for row in rows])
+    return rows
+
+
+@asynccontextmanager
+async def _claim_heartbeat(document_ids: List[int]):
+    """
+    Keep refreshing claimed_at on claimed documents while they are processed
+    
+    Extraction time depends on page counts and on how long Vision calls wait
+    for the semaphore, so a live claim is told apart from an abandoned one by
+    this heartbeat rather than by a fixed processing deadline.
+    """
+    async def beat():
+        while True:
+            await asyncio.sleep(CLAIM_HEARTBEAT_SECONDS)
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(
+                        update(Document)
+                        .where(Document.id.in_(document_ids), Document.status == "processing")
+                        .values(claimed_at=datetime.now(timezone.utc).replace(tzinfo=None))
+                    )
+            except Exception as e:
+                logger.warning(f"Claim heartbeat failed for documents {document_ids}: {str(e)}")
+    
+    heartbeat = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        heartbeat.cancel()
+
+
+async def _mark_failed(document_ids: List[int], error: Exception):
+    """Record an unexpected processing error on the given documents"""
+    try:
+        async with AsyncSessionLocal.begin() as db:
+            await db.execute(
+                update(Document)
+                .where(Document.id.in_(document_ids))
+                .values(status="failed", error_message=str(error))
+            )
+    except Exception as update_error:
+        logger.error(f"Failed to update document status: {str(update_error)}")
+        return
+    
+    await asyncio.gather(*[publish_status(document_id, "failed") for document_id in document_ids])
+
+
+async def process_document_task(document_id: int):
+    """
+    Background task to process document
+    
+    Opens its own connections: the request-scoped session is closed as
+    soon as the response has been sent.
+    """
+    claimed = False
+    try:
+        rows = await _claim_documents([document_id])
+        claimed = bool(rows)
+        if not rows:
+            logger.info(f"Document {document_id} not claimable (missing or already claimed)")
             return
         
-        # Update status to processing
-        document.status = "processing"
-        await db.commit()
+        _, file_path, file_type, retry_count = rows[0]
         
         # Process document
-        result = await document_processor.process_document(
-            document.file_path,
-            document.file_type
+        async with _claim_heartbeat([document_id]):
+            result = await document_processor.process_document(file_path, file_type)
+        values, log_entry = _result_values(
+            document_id, result, retry_count, datetime.now(timezone.utc)
         )
         
-        if result["success"]:
-            # Update document with results
-            document.status = "completed"
-            document.document_type = result["document_type"]
-            document.extracted_data = result["extracted_data"]
-            document.confidence_score = result["confidence_score"]
-            document.processing_time = result["processing_time"]
-            document.validation_errors = result.get("validation_errors", [])
-            document.processed_at = datetime.utcnow()
-            
-            # Log success
-            log_entry = ProcessingLog(
-                document_id=document_id,
-                event_type="extraction",
-                message="Document processed successfully",
-                details={
-                    "document_type": result["document_type"],
-                    "confidence": result["confidence_score"],
-                    "processing_time": result["processing_time"]
-                },
-                timestamp=datetime.utcnow()
-            )
-            db.add(log_entry)
-            
-            logger.info(
-                f"Document {document_id} processed successfully "
-                f"({result['processing_time']:.2f}s)"
-            )
-        else:
-            # Update status to failed
-            document.status = "failed"
-            document.error_message = result.get("error", "Unknown error")
-            document.retry_count += 1
-            
-            # Log error
-            log_entry = ProcessingLog(
-                document_id=document_id,
-                event_type="error",
-                message=f"Processing failed: {result.get('error')}",
-                details={"error": result.get("error")},
-                timestamp=datetime.utcnow()
+        # Persist results and the log entry with a single commit
+        async with AsyncSessionLocal.begin() as db:
+            await db.execute(
+                update(Document).where(Document.id == document_id).values(**values)
             )
             db.add(log_entry)
-            
-            logger.error(f"Document {document_id} processing failed: {result.get('error')}")
-        
-        await db.commit()
         
+        await publish_status(document_id, values["status"])
+    
     except Exception as e:
         logger.error(f"Processing task failed for document {document_id}: {str(e)}", exc_info=True)
-        # Update document status to failed
-        try:
-            result = await db.execute(
-                select(Document).where(Document.id == document_id)
-            )
-            document = result.scalar_one_or_none()
-            if document:
-                document.status = "failed"
-                document.error_message = str(e)
-                await db.commit()
-        except Exception as update_error:
-            logger.error(f"Failed to update document status: {str(update_error)}")
+        # Never touch a document another task owns
+        if claimed:
+            await _mark_failed([document_id], e)
 
 
-@router.post("/process/{document_id}", response_model=ProcessDocumentResponse)
+async def process_documents_batch(document_ids: List[int]):
+    """
+    Process several documents together
+    
+    One claim UPDATE for the whole batch, concurrent extraction (Vision
+    calls stay bounded by the processor's semaphore), and a single bulk
+    write of all results and log entries.
+    """
+    claimed: List[int] = []
+    try:
+        rows = await _claim_documents(document_ids)
+        claimed = [row.id for row in rows]
+        skipped = set(document_ids) - {row.id for row in rows}
+        if skipped:
+            logger.info(f"Documents not claimable (missing or already claimed): {sorted(skipped)}")
+        if not rows:
+            return
+        
+        async with _claim_heartbeat(claimed):
+            results = await asyncio.gather(*[
+                document_processor.process_document(row.file_path, row.file_type)
+                for row in rows
+            ])
+        
+        # One timestamp for the whole batch, written in a single transaction
+        now = datetime.now(timezone.utc)
+        updates = []
+        log_entries = []
+        for row, result in zip(rows, results):
+            values, log_entry = _result_values(row.id, result, row.retry_count, now)
+            updates.append({"id": row.id, **values})
+            log_entries.append(log_entry)
+        
+        async with AsyncSessionLocal.begin() as db:
+            await update_documents(db, updates)
+            db.add_all(log_entries)
+        
+        await asyncio.gather(*[
+            publish_status(values["id"], values["status"]) for values in updates
+        ])
+    
+    except Exception as e:
+        logger.error(f"Batch processing failed for documents {document_ids}: {str(e)}", exc_info=True)
+        # Never touch documents another task owns
+        if claimed:
+            await _mark_failed(claimed, e)
+
+
+@router.post(
+    "/process/{document_id}",
+    response_model=ProcessDocumentResponse,
+    response_class=ORJSONResponse
+)
 async def process_document(
     document_id: int,
     background_tasks: BackgroundTasks,
@@ -120,26 +305,42 @@ async def process_document(
     - Returns structured results
     """
     try:
-        # Get document from database
+        # Reset to pending so status polls can't see (and cache) the previous
+        # terminal state before the task claims the document
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
         result = await db.execute(
-            select(Document).where(Document.id == document_id)
+            update(Document)
+            .where(
+                Document.id == document_id,
+                or_(Document.status != "processing", _stale_claim(now))
+            )
+            .values(status="pending")
+            .returning(Document.id)
         )
-        document = result.scalar_one_or_none()
         
-        if not document:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Document with ID {document_id} not found"
+        if result.scalar_one_or_none() is None:
+            # Only the existence check remains to pick the error
+            exists = await db.execute(
+                select(Document.id).where(Document.id == document_id)
             )
-        
-        if document.status == "processing":
+            if exists.scalar_one_or_none() is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Document with ID {document_id} not found"
+                )
             raise HTTPException(
                 status_code=400,
                 detail="Document is already being processed"
             )
         
-        # Start background processing
-        background_tasks.add_task(process_document_task, document_id, db)
+        await db.commit()
+        invalidate_status_cache(document_id)
+        
+        # Hand off to the job queue when configured, otherwise run in-process
+        if queue_enabled():
+            await enqueue_processing(document_id)
+        else:
+            background_tasks.add_task(process_document_task, document_id)
         
         return ProcessDocumentResponse(
             document_id=document_id,
@@ -162,7 +363,11 @@ async def process_document(
         )
 
 
-@router.get("/process/{document_id}/status", response_model=ProcessDocumentResponse)
+@router.get(
+    "/process/{document_id}/status",
+    response_model=ProcessDocumentResponse,
+    response_class=ORJSONResponse
+)
 async def get_processing_status(
     document_id: int,
     db: AsyncSession = Depends(get_db)
@@ -170,6 +375,10 @@ async def get_processing_status(
     """
     Get processing status and results for a document
     """
+    cached = _status_cache.get(document_id)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    
     try:
         result = await db.execute(
             select(Document).where(Document.id == document_id)
@@ -187,7 +396,7 @@ async def get_processing_status(
         if document.extracted_data and document.status == "completed":
             extracted_data = document.extracted_data
         
-        return ProcessDocumentResponse(
+        response = ProcessDocumentResponse(
             document_id=document.id,
             status=ProcessingStatus(document.status),
             document_type=document.document_type,
@@ -197,6 +406,14 @@ async def get_processing_status(
             validation_errors=document.validation_errors or [],
             message=f"Status: {document.status}"
         )
+        if document.status in TERMINAL_STATUSES:
+            rendered = ORJSONResponse(content=response.model_dump(mode="json"))
+            # A single body larger than the whole cache is just not cached
+            if len(rendered.body) <= STATUS_CACHE_MAX_BYTES:
+                _status_cache[document_id] = rendered.body
+            return rendered
+        
+        return response
         
     except HTTPException:
         raise
@@ -205,4 +422,74 @@ async def get_processing_status(
         raise HTTPException(
             status_code=500,
             detail=f"Status check failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+async def _status_events(document_id: int):
+    """
+    Server-sent event stream of a document's status changes
+    
+    Subscribes before reading the current status so no transition published
+    in between is missed, and ends once a terminal status has been sent.
+    """
+    async with status_pubsub() as pubsub:
+        await pubsub.subscribe(status_channel(document_id))
+        
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Document.status).where(Document.id == document_id)
+            )
+            status = result.scalar_one_or_none()
+        
+        if status is None:
+            return
+        yield f"data: {status}\n\n"
+        
+        while status not in TERMINAL_STATUSES:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=EVENT_KEEPALIVE_SECONDS
+            )
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            
+            status = message["data"].decode()
+            yield f"data: {status}\n\n"
+
+
+@router.get("/process/{document_id}/events")
+async def stream_processing_status(
+    document_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream processing status changes for a document as server-sent events
+    
+    Each event carries the new status; once it is completed or failed the
+    stream ends and the results can be read from the status endpoint. Needs
+    the job queue (Redis); without it clients poll the status endpoint.
+    """
+    if not queue_enabled():
+        raise HTTPException(
+            status_code=503,
+            detail="Status events are unavailable; poll the status endpoint instead"
+        )
+    
+    result = await db.execute(
+        select(Document.id).where(Document.id == document_id)
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Document with ID {document_id} not found"
+        )
+    
+    return StreamingResponse(
+        _status_events(document_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
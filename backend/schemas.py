@@ -2,8 +2,8 @@
 Pydantic schemas for request/response validation
 COMPLETE VERSION - All schemas included
 """
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -52,6 +52,7 @@ class DocumentUploadResponse(BaseModel):
     file_size: int
     status: str
     message: str
+    duplicate: bool = False
 
 
 class ProcessDocumentRequest(BaseModel):
@@ -169,3 +170,50 @@ class ProcessingStatistics(BaseModel):
     failed: int
     average_processing_time: Optional[float] = None
     total_processing_time: Optional[float] = None
+
+
+# Vision API structured output
+# (strict JSON schema mode: every property required, no extra keys)
+class VisionField(BaseModel):
+    """Single field as returned by the Vision API"""
+    model_config = ConfigDict(extra="forbid")
+    
+    field_name: str
+    value: str
+    confidence: float
+    data_type: Literal["text", "number", "date", "currency", "email", "phone", "address"]
+
+
+class VisionLineItem(BaseModel):
+    """Line item row as returned by the Vision API"""
+    model_config = ConfigDict(extra="forbid")
+    
+    description: str
+    quantity: Optional[float]
+    unit_price: Optional[float]
+    amount: Optional[float]
+    confidence: float
+
+
+class VisionMetadata(BaseModel):
+    """Document metadata as returned by the Vision API"""
+    model_config = ConfigDict(extra="forbid")
+    
+    has_logo: bool
+    has_signature: bool
+    quality_score: float
+    language: str
+
+
+class VisionExtraction(BaseModel):
+    """Complete Vision API extraction result"""
+    model_config = ConfigDict(extra="forbid")
+    
+    document_type: Literal[
+        "invoice", "receipt", "purchase_order", "bill", "statement", "form", "contract", "other"
+    ]
+    confidence_score: float
+    fields: List[VisionField]
+    line_items: List[VisionLineItem]
+    raw_text: str
+    metadata: VisionMetadata
@@ -1,27 +1,165 @@
 """
 File upload endpoint
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, Response
+from fastapi.routing import APIRoute
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from typing import BinaryIO, Optional, Tuple
 import aiofiles
-import uuid
+import aiofiles.os
+import asyncio
+import hashlib
+import os
+import secrets
+import sys
 from pathlib import Path
-from datetime import datetime
 import logging
 
-from database import get_db, Document, ProcessingLog
-from config import settings
+from database import get_db, insert_documents, Document, ProcessingLog
+from config import Settings, get_settings
 from schemas import DocumentUploadResponse
 
-router = APIRouter()
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# Allowance for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+_UPLOAD_DIR = Path(get_settings().UPLOAD_DIR)
+
+
+def _file_too_large(settings: Settings) -> HTTPException:
+    """413 error for an upload over MAX_FILE_SIZE"""
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
+    )
+
+
+class UploadRoute(APIRoute):
+    """
+    Route that rejects oversized requests from their Content-Length header
+    
+    The check has to run before FastAPI reads and parses the multipart body,
+    which happens before the endpoint or its dependencies are called. Bodies
+    without a Content-Length (or with a wrong one) are still caught by the
+    size check while streaming to disk.
+    """
+    
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        
+        async def route_handler(request: Request) -> Response:
+            settings = get_settings()
+            content_length = request.headers.get("content-length", "")
+            if (
+                content_length.isdigit()
+                and int(content_length) > settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD
+            ):
+                raise _file_too_large(settings)
+            return await handler(request)
+        
+        return route_handler
+
+
+router = APIRouter(route_class=UploadRoute)
+
+
+async def _find_duplicate(db: AsyncSession, content_hash: str):
+    """Look up an existing document with the same content"""
+    result = await db.execute(
+        select(Document.id, Document.filename, Document.file_size, Document.status)
+        .where(Document.content_hash == content_hash)
+    )
+    return result.one_or_none()
+
+
+def _duplicate_response(existing) -> DocumentUploadResponse:
+    """Response pointing the client at the existing document"""
+    return DocumentUploadResponse(
+        document_id=existing.id,
+        filename=existing.filename,
+        file_size=existing.file_size,
+        status=existing.status,
+        message="Identical document already uploaded. Returning the existing record.",
+        duplicate=True
+    )
+
+
+def _sendfile_to_disk(source: BinaryIO, file_path: Path, size: int) -> str:
+    """
+    Copy a disk-backed upload with sendfile and return its SHA-256
+    
+    The bytes go from the spooled temp file to the destination inside the
+    kernel; only hashing reads them into user space.
+    """
+    source.seek(0)
+    content_hash = hashlib.file_digest(source, "sha256").hexdigest()
+    
+    with open(file_path, "wb") as out:
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(out.fileno(), source.fileno(), offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+    return content_hash
+
+
+async def _save_upload(
+    file: UploadFile,
+    file_path: Path,
+    max_size: int
+) -> Optional[Tuple[int, str]]:
+    """
+    Save an upload to disk and hash it
+    
+    Args:
+        file: Uploaded file
+        file_path: Destination path
+        max_size: Size limit in bytes
+        
+    Returns:
+        (size, sha256 hex digest), or None if the file exceeds max_size
+    """
+    # Large uploads are already spooled to a temp file with a known size:
+    # on Linux copy it with sendfile in a worker thread
+    if (
+        sys.platform == "linux"
+        and file.size is not None
+        and getattr(file.file, "_rolled", False)
+    ):
+        if file.size > max_size:
+            return None
+        loop = asyncio.get_running_loop()
+        content_hash = await loop.run_in_executor(
+            None, _sendfile_to_disk, file.file, file_path, file.size
+        )
+        return file.size, content_hash
+    
+    # Stream to disk in chunks, enforcing the size limit and hashing as we go
+    file_size = 0
+    hasher = hashlib.sha256()
+    async with aiofiles.open(file_path, 'wb') as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            file_size += len(chunk)
+            if file_size > max_size:
+                break
+            hasher.update(chunk)
+            await f.write(chunk)
+    
+    if file_size > max_size:
+        await aiofiles.os.remove(file_path)
+        return None
+    return file_size, hasher.hexdigest()
+
 
 @router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings)
 ):
     """
     Upload a document for processing
@@ -38,65 +176,63 @@ async def upload_document(
                 detail=f"File type not allowed. Allowed types: {settings.ALLOWED_EXTENSIONS}"
             )
         
-        # Read file content
-        content = await file.read()
-        file_size = len(content)
-        
-        # Validate file size
-        if file_size > settings.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
-            )
-        
         # Generate unique filename
         file_extension = Path(file.filename).suffix
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = Path(settings.UPLOAD_DIR) / unique_filename
+        file_type = "pdf" if file_extension.lower() == ".pdf" else "image"
+        unique_filename = f"{secrets.token_hex(16)}{file_extension}"
+        file_path = _UPLOAD_DIR / unique_filename
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(content)
+        saved = await _save_upload(file, file_path, settings.MAX_FILE_SIZE)
         
-        logger.info(f"File saved: {unique_filename} ({file_size} bytes)")
+        # Validate file size
+        if saved is None:
+            raise _file_too_large(settings)
+        file_size, content_hash = saved
         
-        # Determine file type
-        file_type = "pdf" if file_extension.lower() == ".pdf" else "image"
+        # Identical content was uploaded before: reuse it instead of reprocessing
+        existing = await _find_duplicate(db, content_hash)
+        if existing:
+            await aiofiles.os.remove(file_path)
+            logger.info(f"Duplicate upload of document {existing.id}: {file.filename}")
+            return _duplicate_response(existing)
         
-        # Create database record
-        document = Document(
-            filename=unique_filename,
-            original_filename=file.filename,
-            file_path=str(file_path),
-            file_size=file_size,
-            file_type=file_type,
-            status="pending",
-            created_at=datetime.utcnow()
-        )
+        logger.info(f"File saved: {unique_filename} ({file_size} bytes)")
         
-        db.add(document)
-        await db.commit()
-        await db.refresh(document)
+        # Create database record (INSERT ... RETURNING id, no refresh round-trip)
+        try:
+            [document_id] = await insert_documents(db, [{
+                "filename": unique_filename,
+                "original_filename": file.filename,
+                "file_path": str(file_path),
+                "file_size": file_size,
+                "file_type": file_type,
+                "content_hash": content_hash,
+                "status": "pending"
+            }])
+        except IntegrityError:
+            # Lost a race with a concurrent upload of the same content
+            await db.rollback()
+            await aiofiles.os.remove(file_path)
+            return _duplicate_response(await _find_duplicate(db, content_hash))
         
         # Log upload event
         log_entry = ProcessingLog(
-            document_id=document.id,
+            document_id=document_id,
             event_type="upload",
             message=f"Document uploaded: {file.filename}",
             details={
                 "filename": unique_filename,
                 "size": file_size,
                 "type": file_type
-            },
-            timestamp=datetime.utcnow()
+            }
         )
         db.add(log_entry)
         await db.commit()
         
-        logger.info(f"Document record created: ID={document.id}")
+        logger.info(f"Document record created: ID={document_id}")
         
         return DocumentUploadResponse(
-            document_id=document.id,
+            document_id=document_id,
             filename=unique_filename,
             file_size=file_size,
             status="pending",
@@ -0,0 +1,108 @@
+"""
+arq worker for document processing
+Run with: arq worker.WorkerSettings
+"""
+from typing import List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from config import get_settings
+from logging_config import configure_logging
+from jobs import redis_settings, init_queue, close_queue
+from process import process_documents_batch
+from document_processor import document_processor
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class BatchCoalescer:
+    """
+    Collects document IDs from concurrently running jobs and processes
+    them as one batch, flushing when full or after a short wait
+    """
+    
+    def __init__(self, max_size: int, max_wait: float):
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[int, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+    
+    async def submit(self, document_id: int):
+        """Add a document to the next batch and wait for that batch to finish"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((document_id, future))
+        
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        
+        await future
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+    
+    async def _run(self, batch: List[Tuple[int, asyncio.Future]]):
+        try:
+            await process_documents_batch([document_id for document_id, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+
+async def process_document_job(ctx, document_id: int):
+    """Process a single document (coalesced with concurrent jobs into a batch)"""
+    await ctx["batcher"].submit(document_id)
+
+
+async def startup(ctx):
+    """
+    Worker startup
+    
+    The schema is not migrated here: migrate.py (or the API on startup) does
+    it once, so workers never race the API on ALTER TABLE / CREATE INDEX.
+    """
+    configure_logging(settings.LOG_LEVEL)
+    if hasattr(asyncio, "eager_task_factory"):  # Python 3.12+
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    # Used to publish status changes to the API's event streams
+    await init_queue()
+    document_processor.start_executor()
+    ctx["batcher"] = BatchCoalescer(
+        settings.BATCH_MAX_SIZE, settings.BATCH_MAX_WAIT_MS / 1000
+    )
+    logger.info("Document processing worker started")
+
+
+async def shutdown(ctx):
+    """Worker shutdown"""
+    document_processor.shutdown_executor()
+    await close_queue()
+
+
+class WorkerSettings:
+    """arq worker configuration"""
+    functions = [process_document_job]
+    on_startup = startup
+    on_shutdown = shutdown
+    redis_settings = redis_settings()
+    # Enough concurrent jobs to fill a batch; Vision calls are bounded separately
+    max_jobs = max(settings.MAX_CONCURRENT_PROCESSING, settings.BATCH_MAX_SIZE)
+    # A job waits for its whole batch: every page is a Vision call bounded by
+    # EXTRACTION_TIMEOUT, MAX_CONCURRENT_PROCESSING at a time
+    job_timeout = settings.batch_processing_timeout
@@ -0,0 +1,2 @@
+// Deployment configuration: API calls go through the nginx /api/ proxy
+window.API_BASE_URL = '/api';
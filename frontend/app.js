@@ -1,5 +1,5 @@
 // Configuration
-const API_BASE_URL = 'http://localhost:8000/api';
+const API_BASE_URL = window.API_BASE_URL || 'http://localhost:8000/api';
 
 // State management
 let currentDocument = null;
@@ -116,6 +116,13 @@ async function handleFileUpload(file) {
         const uploadData = await uploadResponse.json();
         currentDocument = uploadData;
         
+        // Identical file uploaded before: show its results instead of reprocessing
+        if (uploadData.duplicate && uploadData.status === 'completed') {
+            showUploadStatus(`Already processed: ${file.name}`, 'success');
+            await checkProcessingStatus(uploadData.document_id);
+            return;
+        }
+        
         // Show upload status
         showUploadStatus(`File uploaded: ${file.name}`, 'success');
         
@@ -142,10 +149,7 @@ async function processDocument(documentId) {
         
         showUploadStatus('Processing document...', 'processing');
         
-        // Poll for results
-        pollingInterval = setInterval(async () => {
-            await checkProcessingStatus(documentId);
-        }, 2000);
+        watchProcessingStatus(documentId);
         
     } catch (error) {
         console.error('Processing error:', error);
@@ -154,6 +158,30 @@ async function processDocument(documentId) {
     }
 }
 
+function watchProcessingStatus(documentId) {
+    // Status changes are pushed by the server; poll when events are unavailable
+    const events = new EventSource(`${API_BASE_URL}/process/${documentId}/events`);
+    
+    events.onmessage = async (event) => {
+        if (event.data === 'completed' || event.data === 'failed') {
+            events.close();
+            await checkProcessingStatus(documentId);
+        }
+    };
+    
+    events.onerror = () => {
+        events.close();
+        pollForResults(documentId);
+    };
+}
+
+function pollForResults(documentId) {
+    clearInterval(pollingInterval);
+    pollingInterval = setInterval(async () => {
+        await checkProcessingStatus(documentId);
+    }, 2000);
+}
+
 async function checkProcessingStatus(documentId) {
     try {
         const response = await fetch(`${API_BASE_URL}/process/${documentId}/status`);
@@ -299,10 +327,15 @@ async function exportCurrent() {
             throw new Error('Export failed');
         }
         
-        const data = await response.json();
-        
-        // Download file
-        window.open(`http://localhost:8000${data.download_url}`, '_blank');
+        // Download streamed CSV
+        const disposition = response.headers.get('Content-Disposition') || '';
+        const match = disposition.match(/filename="([^"]+)"/);
+        const blob = await response.blob();
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = match ? match[1] : 'export.csv';
+        link.click();
+        URL.revokeObjectURL(link.href);
         
         showToast('Export successful!', 'success');
         showLoading(false);
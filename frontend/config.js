@@ -0,0 +1,2 @@
+// Deployment configuration (replaced in docker-compose.yml)
+window.API_BASE_URL = 'http://localhost:8000/api';